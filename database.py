@@ -3,217 +3,482 @@ Database module for Library Management System
 Handles all database operations and connections
 """
 
+import calendar
+import logging
+import queue
 import sqlite3
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, Iterator, List, Optional, Tuple
 
-# Database configuration
+logger = logging.getLogger(__name__)
+
+# Database configuration. Connections are opened with uri=True, so a
+# "file:...?" URI such as 'file::memory:?cache=shared' also works here.
 DATABASE = 'library.db'
 
+# Per-connection tuning. journal_mode=WAL is persistent in the DB file and is
+# handled separately by _enable_wal(); the rest must be set on every connection.
+_CONNECTION_PRAGMAS = (
+    "PRAGMA synchronous=NORMAL;"
+    "PRAGMA temp_store=MEMORY;"
+    "PRAGMA cache_size=-64000;"
+    "PRAGMA mmap_size=268435456;"
+)
+
+# Dates are stored as ISO-8601 text; selecting a column as "name [iso_datetime]"
+# has sqlite3 hand it back as a datetime (NULL stays None).
+sqlite3.register_converter('iso_datetime', lambda raw: datetime.fromisoformat(raw.decode()))
+
+# Databases whose books_fts trigram index was created by init_database() in this
+# process; search on any other database scans books instead
+_FTS_DATABASES = set()
+
+# Databases already switched to WAL in this process (DATABASE can be swapped)
+_WAL_DATABASES = set()
+_WAL_LOCK = threading.Lock()
+
+# Process-wide pool of open connections (LIFO keeps the warmest page cache on top)
+_POOL_SIZE = 8
+_POOL: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue(maxsize=_POOL_SIZE)
+_POOL_DATABASE: Optional[str] = None
+_POOL_LOCK = threading.Lock()
+
+# get_all_books() cache. Writes through this module invalidate it, but other
+# processes sharing the DB file cannot, so set BOOKS_CACHE_TTL = 0 to disable
+# it when running several workers.
+BOOKS_CACHE_TTL = 30.0
+_ALL_BOOKS_CACHE = {'ts': 0.0, 'db': None, 'rows': None, 'gen': 0}
+_ALL_BOOKS_LOCK = threading.Lock()
+
+
+def _enable_wal() -> None:
+    """Switch DATABASE to WAL mode once per process (the setting persists on disk)."""
+    db = DATABASE
+    with _WAL_LOCK:
+        if db in _WAL_DATABASES:
+            return
+        conn = sqlite3.connect(db, isolation_level=None, uri=True)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+        finally:
+            conn.close()
+        _WAL_DATABASES.add(db)
+
+
+def _dict_factory(cursor, row) -> Dict:
+    """Build each result row as a plain dict keyed by column name."""
+    return dict(zip([c[0] for c in cursor.description], row))
+
+
 def get_db_connection():
-    """Get a database connection with row factory returning dict-like rows."""
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
+    """Get a database connection whose rows come back as plain dicts."""
+    _enable_wal()
+    conn = sqlite3.connect(DATABASE, isolation_level=None, check_same_thread=False,
+                           detect_types=sqlite3.PARSE_COLNAMES, cached_statements=256, uri=True)
+    conn.executescript(_CONNECTION_PRAGMAS)
+    # SQLite's lower() only folds ASCII; searches use this to match str.lower()
+    conn.create_function('py_lower', 1, lambda s: s.lower() if s is not None else None, deterministic=True)
+    conn.row_factory = _dict_factory
     return conn
 
+
+def close_pool() -> None:
+    """Close every idle pooled connection."""
+    while True:
+        try:
+            conn = _POOL.get_nowait()
+        except queue.Empty:
+            return
+        conn.close()
+
+
+def _ensure_pool() -> str:
+    """Drop pooled connections that point at a different DATABASE (e.g. after a test swaps it)."""
+    global _POOL_DATABASE
+    with _POOL_LOCK:
+        if _POOL_DATABASE != DATABASE:
+            close_pool()
+            _POOL_DATABASE = DATABASE
+        return _POOL_DATABASE
+
+
+def _fill_pool() -> None:
+    """Pre-open connections up to the pool size."""
+    _ensure_pool()
+    while not _POOL.full():
+        conn = get_db_connection()
+        try:
+            _POOL.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+            return
+
+
+@contextmanager
+def borrow_conn():
+    """
+    Check a connection out of the pool for the duration of the block.
+    Any transaction left open is rolled back before the connection is returned.
+    """
+    db = _ensure_pool()
+    try:
+        conn = _POOL.get_nowait()
+    except queue.Empty:
+        conn = get_db_connection()
+    try:
+        yield conn
+    finally:
+        if conn.in_transaction:
+            conn.rollback()
+        if db != DATABASE:
+            conn.close()
+        else:
+            try:
+                _POOL.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+
+
+def epoch_seconds(dt: datetime) -> int:
+    """
+    Seconds since the epoch for a naive local datetime, read as wall-clock time
+    (the same convention as SQLite's strftime('%s', ...) on stored ISO text).
+    """
+    return calendar.timegm(dt.timetuple())
+
+
+# ---------- Shared SQL ----------
+# Statements run on hot paths live here so every call passes the identical
+# string and hits the connection's prepared-statement cache.
+
+_SQL_INSERT_BOOK = (
+    "INSERT INTO books(title, author, isbn, total_copies, available_copies) VALUES (?, ?, ?, ?, ?)"
+)
+_SQL_BOOK_TITLE_AVAIL = 'SELECT title, available_copies FROM books WHERE id = ?'
+_SQL_ACTIVE_BORROW_COUNT = (
+    "SELECT COUNT(*) AS n FROM borrow_records WHERE patron_id = ? AND return_date IS NULL"
+)
+_SQL_INSERT_BORROW = (
+    "INSERT INTO borrow_records(patron_id, book_id, borrow_date, due_date, due_date_epoch, return_date) "
+    "VALUES (?, ?, ?, ?, ?, NULL)"
+)
+_SQL_CREATE_BOOKS_FTS = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS books_fts USING fts5("
+    "title, author, content='books', content_rowid='id', tokenize='trigram')"
+)
+_SQL_FTS_SEARCH = (
+    "SELECT b.* FROM books_fts f JOIN books b ON b.id = f.rowid "
+    "WHERE books_fts MATCH ? ORDER BY b.id"
+)
+# Terms shorter than one trigram, or databases without books_fts, scan books instead
+_SQL_SHORT_SEARCH = {
+    'title': "SELECT * FROM books WHERE instr(py_lower(title), py_lower(?)) > 0 ORDER BY id",
+    'author': "SELECT * FROM books WHERE instr(py_lower(author), py_lower(?)) > 0 ORDER BY id",
+}
+_SQL_PATRON_CURRENT = (
+    'SELECT br.book_id, br.borrow_date AS "borrow_date [iso_datetime]", '
+    'br.due_date AS "due_date [iso_datetime]", br.due_date_epoch, b.title, b.author '
+    "FROM borrow_records br JOIN books b ON b.id = br.book_id "
+    "WHERE br.patron_id = ? AND br.return_date IS NULL "
+    "ORDER BY br.due_date ASC"
+)
+_SQL_PATRON_HISTORY = (
+    'SELECT br.book_id, br.borrow_date AS "borrow_date [iso_datetime]", '
+    'br.return_date AS "return_date [iso_datetime]", b.title '
+    "FROM borrow_records br JOIN books b ON b.id = br.book_id "
+    "WHERE br.patron_id = ? "
+    "ORDER BY br.borrow_date DESC"
+)
+_SQL_PATRON_LOANS_ALL = (
+    'SELECT br.book_id, br.borrow_date AS "borrow_date [iso_datetime]", '
+    'br.due_date AS "due_date [iso_datetime]", br.due_date_epoch, br.return_date AS "return_date [iso_datetime]", '
+    "b.title, b.author, (br.return_date IS NULL) AS is_active "
+    "FROM borrow_records br JOIN books b ON b.id = br.book_id "
+    "WHERE br.patron_id = ? "
+    "ORDER BY br.borrow_date DESC"
+)
+
+
 # ---------- Initialization & Sample Data ----------
 
 def init_database() -> None:
     """Create tables if they do not already exist."""
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute(
-        "CREATE TABLE IF NOT EXISTS books ("
-        "id INTEGER PRIMARY KEY AUTOINCREMENT,"
-        "title TEXT NOT NULL,"
-        "author TEXT NOT NULL,"
-        "isbn TEXT UNIQUE NOT NULL,"
-        "total_copies INTEGER NOT NULL,"
-        "available_copies INTEGER NOT NULL)"
-    )
-    cur.execute(
-        "CREATE TABLE IF NOT EXISTS borrow_records ("
-        "id INTEGER PRIMARY KEY AUTOINCREMENT,"
-        "patron_id TEXT NOT NULL,"
-        "book_id INTEGER NOT NULL,"
-        "borrow_date TEXT NOT NULL,"
-        "due_date TEXT NOT NULL,"
-        "return_date TEXT NULL,"
-        "FOREIGN KEY (book_id) REFERENCES books (id))"
-    )
-    conn.commit()
-    conn.close()
+    with borrow_conn() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            "CREATE TABLE IF NOT EXISTS books ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            "title TEXT NOT NULL,"
+            "author TEXT NOT NULL,"
+            "isbn TEXT UNIQUE NOT NULL,"
+            "total_copies INTEGER NOT NULL,"
+            "available_copies INTEGER NOT NULL)"
+        )
+        cur.execute(
+            "CREATE TABLE IF NOT EXISTS borrow_records ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            "patron_id TEXT NOT NULL,"
+            "book_id INTEGER NOT NULL,"
+            "borrow_date TEXT NOT NULL,"
+            "due_date TEXT NOT NULL,"
+            "due_date_epoch INTEGER NULL,"
+            "return_date TEXT NULL,"
+            "FOREIGN KEY (book_id) REFERENCES books (id))"
+        )
+        # Older databases predate due_date_epoch: add it and backfill from the ISO text
+        columns = {c['name'] for c in cur.execute("PRAGMA table_info(borrow_records)")}
+        if 'due_date_epoch' not in columns:
+            cur.execute("ALTER TABLE borrow_records ADD COLUMN due_date_epoch INTEGER NULL")
+            cur.execute("UPDATE borrow_records SET due_date_epoch = CAST(strftime('%s', due_date) AS INTEGER)")
+        # Active-loan lookups filter on patron_id + return_date IS NULL (often + book_id).
+        # books.isbn needs no extra index: its UNIQUE constraint already creates one.
+        cur.execute(
+            "CREATE INDEX IF NOT EXISTS idx_br_patron_active "
+            "ON borrow_records(patron_id, return_date, book_id)"
+        )
+        cur.execute(
+            "CREATE INDEX IF NOT EXISTS idx_br_patron_book_active "
+            "ON borrow_records(patron_id, book_id, return_date)"
+        )
+        # Trigram full-text index over title/author (substring matching), kept in
+        # sync with books by triggers
+        fts_exists = cur.execute(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'books_fts'"
+        ).fetchone()
+        try:
+            if fts_exists and 'trigram' not in fts_exists['sql']:
+                # Older databases indexed whole words, which only supports prefix search
+                cur.execute("DROP TABLE books_fts")
+                fts_exists = None
+            cur.execute(_SQL_CREATE_BOOKS_FTS)
+        except sqlite3.OperationalError:
+            # SQLite built without FTS5, or older than 3.34 (no trigram tokenizer):
+            # drop the sync triggers so writes still work, and let search scan books
+            for trigger in ('books_fts_ai', 'books_fts_ad', 'books_fts_au'):
+                cur.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+            _FTS_DATABASES.discard(DATABASE)
+        else:
+            cur.execute(
+                "CREATE TRIGGER IF NOT EXISTS books_fts_ai AFTER INSERT ON books BEGIN "
+                "INSERT INTO books_fts(rowid, title, author) VALUES (new.id, new.title, new.author); "
+                "END"
+            )
+            cur.execute(
+                "CREATE TRIGGER IF NOT EXISTS books_fts_ad AFTER DELETE ON books BEGIN "
+                "INSERT INTO books_fts(books_fts, rowid, title, author) VALUES ('delete', old.id, old.title, old.author); "
+                "END"
+            )
+            cur.execute(
+                "CREATE TRIGGER IF NOT EXISTS books_fts_au AFTER UPDATE OF title, author ON books BEGIN "
+                "INSERT INTO books_fts(books_fts, rowid, title, author) VALUES ('delete', old.id, old.title, old.author); "
+                "INSERT INTO books_fts(rowid, title, author) VALUES (new.id, new.title, new.author); "
+                "END"
+            )
+            if not fts_exists:
+                # Index books that predate the FTS table
+                cur.execute("INSERT INTO books_fts(books_fts) VALUES ('rebuild')")
+            _FTS_DATABASES.add(DATABASE)
+        conn.commit()
+    _invalidate_books_cache()
+    _fill_pool()
 
 def add_sample_data() -> None:
     """Insert a few books if catalog is empty (for demo/testing)."""
-    conn = get_db_connection()
-    cur = conn.cursor()
-    count = cur.execute('SELECT COUNT(*) FROM books').fetchone()[0]
+    with borrow_conn() as conn:
+        count = conn.execute('SELECT COUNT(*) AS n FROM books').fetchone()['n']
     if count == 0:
         sample = [
             ('The Great Gatsby', 'F. Scott Fitzgerald', '9780743273565', 3),
             ('To Kill a Mockingbird', 'Harper Lee', '9780061120084', 2),
             ('1984', 'George Orwell', '9780451524935', 4),
         ]
-        for title, author, isbn, total in sample:
-            cur.execute(
-                "INSERT OR IGNORE INTO books(title, author, isbn, total_copies, available_copies) VALUES (?, ?, ?, ?, ?)",
-                (title, author, isbn, total, total)
-            )
+        bulk_insert_books([(t, a, i, n, n) for (t, a, i, n) in sample])
+
+def bulk_insert_books(rows: List[Tuple[str, str, str, int, int]]) -> None:
+    """
+    Insert many (title, author, isbn, total_copies, available_copies) rows in one
+    transaction; rows whose ISBN already exists are skipped.
+    """
+    with borrow_conn() as conn:
+        cur = conn.cursor()
+        cur.execute('BEGIN')
+        cur.executemany(
+            "INSERT OR IGNORE INTO books(title, author, isbn, total_copies, available_copies) VALUES (?, ?, ?, ?, ?)",
+            rows
+        )
         conn.commit()
-    conn.close()
+    _invalidate_books_cache()
 
 # ---------- Book Queries ----------
 
-def get_all_books() -> List[sqlite3.Row]:
-    conn = get_db_connection()
-    rows = conn.execute('SELECT * FROM books ORDER BY id').fetchall()
-    conn.close()
-    return rows
+def _invalidate_books_cache() -> None:
+    # Bumping the generation stops a read that started before this write from
+    # storing its (now stale) rows afterwards.
+    with _ALL_BOOKS_LOCK:
+        _ALL_BOOKS_CACHE['rows'] = None
+        _ALL_BOOKS_CACHE['gen'] += 1
+
+def iter_all_books() -> Iterator[Dict]:
+    """Stream the catalog row by row; the pooled connection is held until the generator finishes."""
+    with borrow_conn() as conn:
+        yield from conn.execute('SELECT * FROM books ORDER BY id')
+
+def get_all_books() -> List[Dict]:
+    """Return the catalog; each call gets its own copies of the row dicts."""
+    cache = _ALL_BOOKS_CACHE
+    with _ALL_BOOKS_LOCK:
+        rows = cache['rows']
+        gen = cache['gen']
+        fresh = cache['db'] == DATABASE and time.monotonic() - cache['ts'] < BOOKS_CACHE_TTL
+    if rows is not None and fresh:
+        return [dict(r) for r in rows]
+    rows = list(iter_all_books())
+    if BOOKS_CACHE_TTL > 0:
+        with _ALL_BOOKS_LOCK:
+            if cache['gen'] == gen:
+                cache.update(ts=time.monotonic(), db=DATABASE, rows=rows)
+    return [dict(r) for r in rows]
+
+def get_book_by_id(book_id: int) -> Optional[Dict]:
+    with borrow_conn() as conn:
+        return conn.execute('SELECT * FROM books WHERE id = ?', (book_id,)).fetchone()
 
-def get_book_by_id(book_id: int) -> Optional[sqlite3.Row]:
-    conn = get_db_connection()
-    row = conn.execute('SELECT * FROM books WHERE id = ?', (book_id,)).fetchone()
-    conn.close()
-    return row
+def get_book_title_and_availability(book_id: int) -> Optional[Dict]:
+    """Fetch only title and available_copies for callers that don't need the full row."""
+    with borrow_conn() as conn:
+        return conn.execute(_SQL_BOOK_TITLE_AVAIL, (book_id,)).fetchone()
 
-def get_book_by_isbn(isbn: str) -> Optional[sqlite3.Row]:
-    conn = get_db_connection()
-    row = conn.execute('SELECT * FROM books WHERE isbn = ?', (isbn,)).fetchone()
-    conn.close()
-    return row
+def get_book_by_isbn(isbn: str) -> Optional[Dict]:
+    with borrow_conn() as conn:
+        return conn.execute('SELECT * FROM books WHERE isbn = ?', (isbn,)).fetchone()
 
 def insert_book(title: str, author: str, isbn: str, total_copies: int) -> int:
     """Insert a book and return new book id."""
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute(
-        "INSERT INTO books(title, author, isbn, total_copies, available_copies) VALUES(?, ?, ?, ?, ?)",
-        (title, author, isbn, total_copies, total_copies)
-    )
-    conn.commit()
-    new_id = cur.lastrowid
-    conn.close()
-    return new_id
+    with borrow_conn() as conn:
+        cur = conn.cursor()
+        cur.execute(_SQL_INSERT_BOOK, (title, author, isbn, total_copies, total_copies))
+        conn.commit()
+    _invalidate_books_cache()
+    return cur.lastrowid
 
 def update_book_availability(book_id: int, delta: int) -> bool:
     """
     Increment/decrement available_copies by delta ensuring bounds (0..total).
     Returns True if updated, False otherwise.
     """
-    conn = get_db_connection()
-    cur = conn.cursor()
-    row = cur.execute('SELECT available_copies, total_copies FROM books WHERE id=?', (book_id,)).fetchone()
-    if not row:
-        conn.close()
-        return False
-    new_avail = row['available_copies'] + delta
-    if new_avail < 0 or new_avail > row['total_copies']:
-        conn.close()
-        return False
-    cur.execute('UPDATE books SET available_copies = ? WHERE id = ?', (new_avail, book_id))
-    conn.commit()
-    conn.close()
+    return update_book_availability_bulk({book_id: delta})
+
+def update_book_availability_bulk(deltas: Dict[int, int]) -> bool:
+    """
+    Apply {book_id: delta} to available_copies for several books in one UPDATE.
+    All-or-nothing: returns False and changes nothing if any book is missing or
+    would leave the 0..total_copies range.
+    """
+    if not deltas:
+        return True
+    ids = list(deltas)
+    new_avail = 'CASE id ' + ' '.join('WHEN ? THEN available_copies + ?' for _ in ids) + ' END'
+    case_params = [p for bid in ids for p in (bid, deltas[bid])]
+    id_marks = ', '.join('?' for _ in ids)
+    with borrow_conn() as conn:
+        cur = conn.cursor()
+        cur.execute('BEGIN IMMEDIATE')
+        cur.execute(
+            f"UPDATE books SET available_copies = {new_avail} "
+            f"WHERE id IN ({id_marks}) AND {new_avail} BETWEEN 0 AND total_copies",
+            case_params + ids + case_params
+        )
+        if cur.rowcount != len(ids):
+            return False  # borrow_conn rolls back the partial update
+        conn.commit()
+    _invalidate_books_cache()
     return True
 
 # ---------- Borrowing ----------
 
 def get_patron_borrow_count(patron_id: str) -> int:
     """Count active (not returned) borrow records for patron."""
-    conn = get_db_connection()
-    count = conn.execute(
-        "SELECT COUNT(*) FROM borrow_records WHERE patron_id = ? AND return_date IS NULL",
-        (patron_id,)
-    ).fetchone()[0]
-    conn.close()
+    with borrow_conn() as conn:
+        count = conn.execute(_SQL_ACTIVE_BORROW_COUNT, (patron_id,)).fetchone()['n']
     return int(count)
 
 def insert_borrow_record(patron_id: str, book_id: int, borrow_date: datetime, due_date: datetime) -> int:
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute(
-        "INSERT INTO borrow_records(patron_id, book_id, borrow_date, due_date, return_date) VALUES (?, ?, ?, ?, NULL)",
-        (patron_id, book_id, borrow_date.isoformat(), due_date.isoformat())
-    )
-    conn.commit()
-    rid = cur.lastrowid
-    conn.close()
-    return rid
-
-def get_active_borrow_record(patron_id: str, book_id: int) -> Optional[sqlite3.Row]:
+    with borrow_conn() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            _SQL_INSERT_BORROW,
+            (patron_id, book_id, borrow_date.isoformat(), due_date.isoformat(), epoch_seconds(due_date))
+        )
+        conn.commit()
+        return cur.lastrowid
+
+def get_active_borrow_record(patron_id: str, book_id: int) -> Optional[Dict]:
     """Return the active (not yet returned) borrow record for patron/book if any."""
-    conn = get_db_connection()
-    row = conn.execute(
-        "SELECT * FROM borrow_records WHERE patron_id = ? AND book_id = ? AND return_date IS NULL ORDER BY id DESC LIMIT 1",
-        (patron_id, book_id)
-    ).fetchone()
-    conn.close()
-    return row
+    with borrow_conn() as conn:
+        return conn.execute(
+            "SELECT * FROM borrow_records WHERE patron_id = ? AND book_id = ? AND return_date IS NULL ORDER BY id DESC LIMIT 1",
+            (patron_id, book_id)
+        ).fetchone()
 
 def update_borrow_record_return_date(patron_id: str, book_id: int, return_date: datetime) -> bool:
-    conn = get_db_connection()
-    cur = conn.cursor()
-    # Update only the most recent active borrow record for this patron/book
-    cur.execute(
-        "UPDATE borrow_records SET return_date = ? WHERE id = ("
-        "SELECT id FROM borrow_records WHERE patron_id = ? AND book_id = ? AND return_date IS NULL ORDER BY id DESC LIMIT 1"
-        ")",
-        (return_date.isoformat(), patron_id, book_id)
-    )
-    updated = cur.rowcount
-    conn.commit()
-    conn.close()
-    return updated > 0
+    with borrow_conn() as conn:
+        cur = conn.cursor()
+        # Update only the most recent active borrow record for this patron/book
+        cur.execute(
+            "UPDATE borrow_records SET return_date = ? WHERE id = ("
+            "SELECT id FROM borrow_records WHERE patron_id = ? AND book_id = ? AND return_date IS NULL ORDER BY id DESC LIMIT 1"
+            ")",
+            (return_date.isoformat(), patron_id, book_id)
+        )
+        conn.commit()
+        return cur.rowcount > 0
 
 def get_patron_current_borrows(patron_id: str):
-    conn = get_db_connection()
-    rows = conn.execute(
-        "SELECT br.*, b.title, b.author, b.isbn "
-        "FROM borrow_records br JOIN books b ON b.id = br.book_id "
-        "WHERE br.patron_id = ? AND br.return_date IS NULL "
-        "ORDER BY br.due_date ASC",
-        (patron_id,)
-    ).fetchall()
-    conn.close()
-    return rows
+    with borrow_conn() as conn:
+        return conn.execute(
+            "SELECT br.*, b.title, b.author, b.isbn "
+            "FROM borrow_records br JOIN books b ON b.id = br.book_id "
+            "WHERE br.patron_id = ? AND br.return_date IS NULL "
+            "ORDER BY br.due_date ASC",
+            (patron_id,)
+        ).fetchall()
 
 def get_patron_borrow_history(patron_id: str):
-    conn = get_db_connection()
-    rows = conn.execute(
-        "SELECT br.*, b.title, b.author, b.isbn "
-        "FROM borrow_records br JOIN books b ON b.id = br.book_id "
-        "WHERE br.patron_id = ? "
-        "ORDER BY br.borrow_date DESC",
-        (patron_id,)
-    ).fetchall()
-    conn.close()
-    return rows
+    with borrow_conn() as conn:
+        return conn.execute(
+            "SELECT br.*, b.title, b.author, b.isbn "
+            "FROM borrow_records br JOIN books b ON b.id = br.book_id "
+            "WHERE br.patron_id = ? "
+            "ORDER BY br.borrow_date DESC",
+            (patron_id,)
+        ).fetchall()
 
 # ---------- Search ----------
 
+def _search_books_column(column: str, term: str) -> List[Dict]:
+    """Case-insensitive substring search on one books column (R6 partial matching)."""
+    if not term.strip():
+        return []
+    if len(term) >= 3 and DATABASE in _FTS_DATABASES:
+        # A quoted phrase on a trigram index matches term anywhere in the column
+        sql, param = _SQL_FTS_SEARCH, column + ':"' + term.replace('"', '""') + '"'
+    else:
+        sql, param = _SQL_SHORT_SEARCH[column], term
+    with borrow_conn() as conn:
+        return conn.execute(sql, (param,)).fetchall()
+
 def search_books_title(term: str):
-    conn = get_db_connection()
-    like = f'%{term.lower()}%'
-    rows = conn.execute(
-        "SELECT * FROM books WHERE LOWER(title) LIKE ? ORDER BY id", (like,)
-    ).fetchall()
-    conn.close()
-    return rows
+    return _search_books_column('title', term)
 
 def search_books_author(term: str):
-    conn = get_db_connection()
-    like = f'%{term.lower()}%'
-    rows = conn.execute(
-        "SELECT * FROM books WHERE LOWER(author) LIKE ? ORDER BY id", (like,)
-    ).fetchall()
-    conn.close()
-    return rows
+    return _search_books_column('author', term)
 
 def search_books_isbn(isbn: str):
-    conn = get_db_connection()
-    rows = conn.execute('SELECT * FROM books WHERE isbn = ? ORDER BY id', (isbn,)).fetchall()
-    conn.close()
-    return rows
+    with borrow_conn() as conn:
+        return conn.execute('SELECT * FROM books WHERE isbn = ? ORDER BY id', (isbn,)).fetchall()
 
 
 def get_patron_borrowed_books(patron_id: str):
@@ -221,34 +486,29 @@ def get_patron_borrowed_books(patron_id: str):
     Return a list of ACTIVE borrows for the patron.
     Each item has at least: book_id, title, author, borrow_date (datetime), due_date (datetime), is_overdue (bool)
     """
-    conn = get_db_connection()
-    rows = conn.execute(
-        "SELECT br.book_id, br.borrow_date, br.due_date, b.title, b.author "
-        "FROM borrow_records br JOIN books b ON b.id = br.book_id "
-        "WHERE br.patron_id = ? AND br.return_date IS NULL "
-        "ORDER BY br.due_date ASC",
-        (patron_id,)
-    ).fetchall()
-    conn.close()
-
-    out = []
-    for r in rows:
+    with borrow_conn() as conn:
         try:
-            borrow_dt = datetime.fromisoformat(r['borrow_date']) if isinstance(r['borrow_date'], str) else r['borrow_date']
-            due_dt = datetime.fromisoformat(r['due_date']) if isinstance(r['due_date'], str) else r['due_date']
-        except Exception:
-            # Fallback: treat as not overdue if parsing fails
-            borrow_dt = datetime.now()
-            due_dt = datetime.now()
-        out.append({
-            'book_id': r['book_id'],
-            'title': r['title'],
-            'author': r['author'],
-            'borrow_date': borrow_dt,
-            'due_date': due_dt,
-            'is_overdue': datetime.now() > due_dt
-        })
-    return out
+            rows = conn.execute(_SQL_PATRON_CURRENT, (patron_id,)).fetchall()
+        except ValueError:
+            # A malformed stored date; nothing trustworthy to report
+            logger.exception("Malformed stored date in active loans for patron %s", patron_id)
+            return []
+
+    now = datetime.now()
+    now_epoch = epoch_seconds(now)
+    for r in rows:
+        due_epoch = r['due_date_epoch']
+        r['is_overdue'] = now > r['due_date'] if due_epoch is None else now_epoch > due_epoch
+    return rows
+
+
+def iter_patron_borrow_history(patron_id: str) -> Iterator[Dict]:
+    """
+    Stream ALL borrows for the patron, newest first, holding the pooled connection until exhausted.
+    Each item has at least: book_id, title, borrow_date (datetime), return_date (datetime or None)
+    """
+    with borrow_conn() as conn:
+        yield from conn.execute(_SQL_PATRON_HISTORY, (patron_id,))
 
 
 def get_patron_borrow_history(patron_id: str):
@@ -256,33 +516,94 @@ def get_patron_borrow_history(patron_id: str):
     Return a list of ALL borrows for the patron.
     Each item has at least: book_id, title, borrow_date (datetime), return_date (datetime or None)
     """
-    conn = get_db_connection()
-    rows = conn.execute(
-        "SELECT br.book_id, br.borrow_date, br.return_date, b.title "
-        "FROM borrow_records br JOIN books b ON b.id = br.book_id "
-        "WHERE br.patron_id = ? "
-        "ORDER BY br.borrow_date DESC",
-        (patron_id,)
-    ).fetchall()
-    conn.close()
-
-    out = []
-    for r in rows:
+    try:
+        return list(iter_patron_borrow_history(patron_id))
+    except ValueError:
+        # A malformed stored date; nothing trustworthy to report
+        logger.exception("Malformed stored date in borrow history for patron %s", patron_id)
+        return []
+
+
+def get_patron_loans_all(patron_id: str):
+    """
+    Return ALL borrows for the patron, newest first, from a single JOIN.
+    Each item has: book_id, title, author, borrow_date, due_date, return_date (datetime or None), is_active (bool)
+    """
+    with borrow_conn() as conn:
         try:
-            borrow_dt = datetime.fromisoformat(r['borrow_date']) if isinstance(r['borrow_date'], str) else r['borrow_date']
-        except Exception:
-            borrow_dt = datetime.now()
-        if r['return_date'] is None:
-            return_dt = None
-        else:
-            try:
-                return_dt = datetime.fromisoformat(r['return_date']) if isinstance(r['return_date'], str) else r['return_date']
-            except Exception:
-                return_dt = None
-        out.append({
-            'book_id': r['book_id'],
-            'title': r['title'],
-            'borrow_date': borrow_dt,
-            'return_date': return_dt
-        })
-    return out
+            rows = conn.execute(_SQL_PATRON_LOANS_ALL, (patron_id,)).fetchall()
+        except ValueError:
+            # A malformed stored date; nothing trustworthy to report
+            logger.exception("Malformed stored date in loans for patron %s", patron_id)
+            return []
+
+    for r in rows:
+        r['is_active'] = bool(r['is_active'])
+    return rows
+
+
+# ---------- Atomic Borrow / Return ----------
+
+def borrow_atomic(patron_id: str, book_id: int, borrow_date: datetime, due_date: datetime,
+                  max_borrows: int) -> Tuple[str, Optional[str]]:
+    """
+    Check availability and the patron's limit, decrement the book and insert the
+    borrow record in a single IMMEDIATE transaction.
+    Returns (status, title) where status is one of
+    'ok', 'not_found', 'unavailable', 'limit_reached'.
+    """
+    with borrow_conn() as conn:
+        cur = conn.cursor()
+        cur.execute('BEGIN IMMEDIATE')
+        # Early returns leave the transaction open; borrow_conn rolls it back.
+        book = cur.execute(_SQL_BOOK_TITLE_AVAIL, (book_id,)).fetchone()
+        if not book:
+            return 'not_found', None
+        if book['available_copies'] <= 0:
+            return 'unavailable', book['title']
+        count = cur.execute(_SQL_ACTIVE_BORROW_COUNT, (patron_id,)).fetchone()['n']
+        if count >= max_borrows:
+            return 'limit_reached', book['title']
+        cur.execute(
+            'UPDATE books SET available_copies = available_copies - 1 WHERE id = ? AND available_copies > 0',
+            (book_id,)
+        )
+        if cur.rowcount != 1:
+            return 'unavailable', book['title']
+        cur.execute(
+            _SQL_INSERT_BORROW,
+            (patron_id, book_id, borrow_date.isoformat(), due_date.isoformat(), epoch_seconds(due_date))
+        )
+        conn.commit()
+    _invalidate_books_cache()
+    return 'ok', book['title']
+
+def return_atomic(patron_id: str, book_id: int, return_date: datetime) -> Tuple[str, Optional[str], Optional[int]]:
+    """
+    Close the patron's most recent active borrow record for the book and increment
+    availability in a single IMMEDIATE transaction.
+    Returns (status, title, due_date_epoch) where status is one of
+    'ok', 'not_found', 'no_active_record', 'availability_error'.
+    """
+    with borrow_conn() as conn:
+        cur = conn.cursor()
+        cur.execute('BEGIN IMMEDIATE')
+        book = cur.execute('SELECT title FROM books WHERE id = ?', (book_id,)).fetchone()
+        if not book:
+            return 'not_found', None, None
+        record = cur.execute(
+            "SELECT id, due_date_epoch FROM borrow_records WHERE patron_id = ? AND book_id = ? AND return_date IS NULL ORDER BY id DESC LIMIT 1",
+            (patron_id, book_id)
+        ).fetchone()
+        if not record:
+            return 'no_active_record', book['title'], None
+        cur.execute('UPDATE borrow_records SET return_date = ? WHERE id = ?', (return_date.isoformat(), record['id']))
+        cur.execute(
+            'UPDATE books SET available_copies = available_copies + 1 WHERE id = ? AND available_copies < total_copies',
+            (book_id,)
+        )
+        if cur.rowcount != 1:
+            return 'availability_error', book['title'], None
+        conn.commit()
+    _invalidate_books_cache()
+    return 'ok', book['title'], record['due_date_epoch']
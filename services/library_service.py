@@ -4,18 +4,20 @@ Library Service Module - Business Logic Functions
 Contains all the core business logic for the Library Management System
 """
 
+import sqlite3
 from datetime import datetime, timedelta
+from functools import lru_cache
 from typing import Dict, Optional, List, Tuple, Any
 import database  # keep module ref so tests can monkeypatch database.*
 from database import (
-    get_book_by_id, get_book_by_isbn, get_patron_borrow_count,
-    insert_borrow_record, update_book_availability,
-    update_borrow_record_return_date,
+    get_book_title_and_availability, get_book_by_isbn, borrow_atomic, return_atomic,
 )
 from services.payment_service import PaymentGateway
 
 MAX_BORROW_LIMIT = 5
 BORROW_DAYS = 14
+SECONDS_PER_DAY = 86400
+SEARCH_TYPES = frozenset({'title', 'author', 'isbn'})
 
 
 def _is_valid_isbn13(isbn: str) -> bool:
@@ -26,6 +28,11 @@ def _is_valid_patron_id(pid: str) -> bool:
     return pid.isdigit() and len(pid) == 6
 
 
+def _is_valid_book_id(book_id) -> bool:
+    # bool is an int subclass; True must not pass as book 1
+    return isinstance(book_id, int) and not isinstance(book_id, bool) and book_id > 0
+
+
 def insert_book(title: str, author: str, isbn: str, total_copies: int, available_copies: int):
     # Ignore available_copies here; DB layer computes availability internally.
     return database.insert_book(title, author, isbn, total_copies)
@@ -72,27 +79,29 @@ def add_book_to_catalog(title: str, author: str, isbn: str, total_copies: int) -
 def borrow_book_by_patron(patron_id: str, book_id: int) -> Tuple[bool, str]:
     """
     Borrow a book for a patron (R3). Messages match the tests.
+    Availability check, limit check, decrement and insert run in one transaction.
     """
     if not _is_valid_patron_id(patron_id):
         return False, "Invalid patron ID. Must be exactly 6 digits."
-
-    book = get_book_by_id(book_id)
-    if not book:
+    if not _is_valid_book_id(book_id):
         return False, "Book not found."
-    if int(book["available_copies"]) <= 0:
-        return False, "This book is currently not available."
-    if get_patron_borrow_count(patron_id) >= MAX_BORROW_LIMIT:
-        return False, "You have reached the maximum borrowing limit of 5 books."
 
     borrow_date = datetime.now()
     due_date = borrow_date + timedelta(days=BORROW_DAYS)
 
-    if not insert_borrow_record(patron_id, book_id, borrow_date, due_date):
+    try:
+        status, title = borrow_atomic(patron_id, book_id, borrow_date, due_date, MAX_BORROW_LIMIT)
+    except sqlite3.Error:
         return False, "Database error occurred while creating borrow record."
-    if not update_book_availability(book_id, -1):
-        return False, "Database error occurred while updating book availability."
 
-    return True, f'Borrowed "{book["title"]}" successfully. Due date: {due_date.strftime("%Y-%m-%d")}.'
+    if status == 'not_found':
+        return False, "Book not found."
+    if status == 'unavailable':
+        return False, "This book is currently not available."
+    if status == 'limit_reached':
+        return False, "You have reached the maximum borrowing limit of 5 books."
+
+    return True, f'Borrowed "{title}" successfully. Due date: {due_date.strftime("%Y-%m-%d")}.'
 
 
 # ---------------- R4 ----------------
@@ -100,31 +109,37 @@ def borrow_book_by_patron(patron_id: str, book_id: int) -> Tuple[bool, str]:
 def return_book_by_patron(patron_id: str, book_id: int) -> Tuple[bool, str]:
     """
     Return flow and messages match tests exactly.
+    Closing the borrow record and incrementing availability run in one transaction.
     """
     if not _is_valid_patron_id(patron_id):
         return False, "Invalid patron ID. Must be exactly 6 digits."
-
-    book = get_book_by_id(book_id)
-    if not book:
+    if not _is_valid_book_id(book_id):
         return False, "Book not found."
 
     return_dt = datetime.now()
-    if not update_borrow_record_return_date(patron_id, book_id, return_dt):
-        return False, "No active borrow record found for this patron and book."
+    try:
+        status, title, due_epoch = return_atomic(patron_id, book_id, return_dt)
+    except sqlite3.Error:
+        return False, "Database error occurred while updating book availability."
 
-    if not update_book_availability(book_id, +1):
+    if status == 'not_found':
+        return False, "Book not found."
+    if status == 'no_active_record':
+        return False, "No active borrow record found for this patron and book."
+    if status == 'availability_error':
         return False, "Database error occurred while updating book availability."
 
-    fee_data = calculate_late_fee_for_book(patron_id, book_id)
-    fee_amount = float(fee_data.get('fee_amount', 0.0))
+    # The record is closed now, so price the fee from the due date it carried
+    fee_amount = float(_late_fee_for_loan({'due_date_epoch': due_epoch}, return_dt).get('fee_amount', 0.0))
     if fee_amount > 0:
-        return True, f'Return processed for "{book["title"]}". Late fee: ${fee_amount:.2f}.'
+        return True, f'Return processed for "{title}". Late fee: ${fee_amount:.2f}.'
     else:
-        return True, f'Return processed for "{book["title"]}". No late fee.'
+        return True, f'Return processed for "{title}". No late fee.'
 
 
 # ---------------- R5 (late fee calculation) ----------------
 
+@lru_cache(maxsize=256)
 def _compute_fee(days_overdue: int) -> float:
     if days_overdue <= 0:
         return 0.0
@@ -134,15 +149,63 @@ def _compute_fee(days_overdue: int) -> float:
     return round(15.0 if total > 15.0 else total, 2)
 
 
-def calculate_late_fee_for_book(patron_id: str, book_id: int) -> Dict[str, Any]:
+def _late_fee_for_due_date(due, now: Optional[datetime] = None) -> Dict[str, Any]:
+    """
+    Returns {'fee_amount': float, 'days_overdue': int} for a due date (datetime or ISO string).
+    Loops pass `now` so the clock is read once rather than per row.
+    """
+    if isinstance(due, str):
+        try:
+            due_dt = datetime.fromisoformat(due)
+        except Exception:
+            return {'fee_amount': 0.0, 'days_overdue': 0}
+    else:
+        due_dt = due
+    if due_dt is None:
+        return {'fee_amount': 0.0, 'days_overdue': 0}
+
+    if now is None:
+        now = datetime.now()
+    days_overdue = (now.date() - due_dt.date()).days
+    if days_overdue < 0:
+        days_overdue = 0
+    return {'fee_amount': _compute_fee(days_overdue), 'days_overdue': int(days_overdue)}
+
+
+def _late_fee_for_loan(loan: Dict[str, Any], now: Optional[datetime] = None,
+                       now_day: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Price a loan row. Rows from the DB carry due_date_epoch, which is priced with
+    integer day arithmetic; rows without it fall back to parsing due_date.
+    Loops pass `now_day` (epoch seconds // SECONDS_PER_DAY) so it is computed once.
+    """
+    due_epoch = loan.get('due_date_epoch')
+    if due_epoch is None:
+        return _late_fee_for_due_date(loan.get('due_date'), now)
+    if now_day is None:
+        if now is None:
+            now = datetime.now()
+        now_day = database.epoch_seconds(now) // SECONDS_PER_DAY
+    days_overdue = now_day - int(due_epoch) // SECONDS_PER_DAY
+    if days_overdue < 0:
+        days_overdue = 0
+    return {'fee_amount': _compute_fee(days_overdue), 'days_overdue': int(days_overdue)}
+
+
+def calculate_late_fee_for_book(patron_id: str, book_id: int,
+                                borrowed: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
     """
     Returns {'fee_amount': float, 'days_overdue': int}.
-    Uses database.get_patron_borrowed_books(monkeypatched in tests).
+    Uses database.get_patron_borrowed_books(monkeypatched in tests) unless the
+    caller already holds the patron's active borrows in `borrowed`.
     """
-    try:
-        borrowed = database.get_patron_borrowed_books(patron_id)
-    except Exception:
-        borrowed = []
+    if not _is_valid_book_id(book_id):
+        return {'fee_amount': 0.0, 'days_overdue': 0}
+    if borrowed is None:
+        try:
+            borrowed = database.get_patron_borrowed_books(patron_id)
+        except Exception:
+            borrowed = []
 
     match = None
     for r in borrowed:
@@ -156,49 +219,31 @@ def calculate_late_fee_for_book(patron_id: str, book_id: int) -> Dict[str, Any]:
     if not match:
         return {'fee_amount': 0.0, 'days_overdue': 0}
 
-    due = match.get('due_date')
-    if isinstance(due, str):
-        try:
-            due_dt = datetime.fromisoformat(due)
-        except Exception:
-            return {'fee_amount': 0.0, 'days_overdue': 0}
-    else:
-        due_dt = due
-
-    days_overdue = (datetime.now().date() - due_dt.date()).days
-    if days_overdue < 0:
-        days_overdue = 0
-    return {'fee_amount': _compute_fee(days_overdue), 'days_overdue': int(days_overdue)}
+    return _late_fee_for_loan(match)
 
 
 # ---------------- R6 ----------------
 
 def search_books_in_catalog(search_term: str, search_type: str = 'title'):
     """
-    Title/Author: partial, case-insensitive over database.get_all_books().
+    Title/Author: partial, case-insensitive via database.search_books_title/author().
     ISBN: exact via database.get_book_by_isbn().
     Invalid type: [].
     """
     term = (search_term or '').strip()
     stype = (search_type or 'title').lower()
-    if not term:
+    if not term or stype not in SEARCH_TYPES:
         return []
 
     if stype == 'title':
-        books = list(database.get_all_books())  # tests patch `database.get_all_books`
-        t = term.lower()
-        return [b for b in books if t in str(b.get('title', '')).lower()]
+        return list(database.search_books_title(term))
 
     if stype == 'author':
-        books = list(database.get_all_books())
-        t = term.lower()
-        return [b for b in books if t in str(b.get('author', '')).lower()]
+        return list(database.search_books_author(term))
 
-    if stype == 'isbn':
-        book = database.get_book_by_isbn(term)
-        return [book] if book else []
-
-    return []
+    # stype == 'isbn': SEARCH_TYPES has no other member
+    book = database.get_book_by_isbn(term)
+    return [book] if book else []
 
 
 # ---------------- R7 ----------------
@@ -217,24 +262,37 @@ def get_patron_status_report(patron_id: str) -> Dict[str, Any]:
         }
 
     try:
-        current = database.get_patron_borrowed_books(patron_id)
-    except Exception:
-        current = []
-    try:
-        history = database.get_patron_borrow_history(patron_id)
+        loans = database.get_patron_loans_all(patron_id)
     except Exception:
-        history = []
+        loans = []
 
     def _as_iso(d):
         if isinstance(d, datetime):
             return d.isoformat()
         return str(d) if d is not None else None
 
+    # One pass: every loan is history, unreturned ones are also current
+    current: List[Dict[str, Any]] = []
+    hist_list: List[Dict[str, Any]] = []
+    for r in loans:
+        if r['is_active']:
+            current.append(r)
+        hist_list.append({
+            'book_id': r.get('book_id'),
+            'title': r.get('title'),
+            'borrow_date': _as_iso(r.get('borrow_date')),
+            'return_date': _as_iso(r.get('return_date')),
+        })
+    current.sort(key=lambda r: r['due_date'])
+
     cur_list: List[Dict[str, Any]] = []
     total_fees = 0.0
+    now = datetime.now()
+    now_day = database.epoch_seconds(now) // SECONDS_PER_DAY
     for r in current:
         bid = r.get('book_id')
-        fee_info = calculate_late_fee_for_book(patron_id, bid)
+        # Price from the row we already hold instead of re-querying per book
+        fee_info = _late_fee_for_loan(r, now, now_day)
         total_fees += float(fee_info.get('fee_amount', 0.0))
         cur_list.append({
             'book_id': bid,
@@ -242,15 +300,6 @@ def get_patron_status_report(patron_id: str) -> Dict[str, Any]:
             'due_date': _as_iso(r.get('due_date')),
         })
 
-    hist_list: List[Dict[str, Any]] = []
-    for r in history:
-        hist_list.append({
-            'book_id': r.get('book_id'),
-            'title': r.get('title'),
-            'borrow_date': _as_iso(r.get('borrow_date')),
-            'return_date': _as_iso(r.get('return_date')),
-        })
-
     return {
         'currently_borrowed': cur_list,
         'borrowing_history': hist_list,
@@ -297,7 +346,7 @@ def pay_late_fees(patron_id: str, book_id: int, payment_gateway: PaymentGateway
         return False, "No late fees to pay for this book.", None
     
     # Get book details for payment description
-    book = get_book_by_id(book_id)
+    book = get_book_title_and_availability(book_id)
     if not book:
         return False, "Book not found.", None
     
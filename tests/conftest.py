@@ -6,3 +6,15 @@ import sys
 PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 if PROJECT_ROOT not in sys.path:
     sys.path.insert(0, PROJECT_ROOT)
+
+import pytest
+import database
+
+
+@pytest.fixture
+def tmp_db(tmp_path, monkeypatch):
+    """Point the app at a fresh on-disk SQLite database for one test."""
+    monkeypatch.setattr(database, 'DATABASE', str(tmp_path / 'library.db'))
+    database.init_database()
+    yield
+    database.close_pool()
@@ -3,7 +3,7 @@
 import time
 
 import pytest
-from playwright.sync_api import sync_playwright
+from playwright.sync_api import expect, sync_playwright
 
 BASE_URL = "http://127.0.0.1:5000"
 
@@ -19,13 +19,21 @@ def browser():
         browser.close()
 
 
-@pytest.fixture
-def page(browser):
-    """Create a fresh page for each test."""
+@pytest.fixture(scope="session")
+def context(browser):
+    """Share one browser context (and its Chromium profile) across the session."""
     context = browser.new_context()
+    yield context
+    context.close()
+
+
+@pytest.fixture
+def page(context):
+    """Create a fresh page for each test; clearing cookies drops the Flask session/flashes."""
+    context.clear_cookies()
     page = context.new_page()
     yield page
-    context.close()
+    page.close()
 
 
 # ---------- Helper: add a unique book through the real UI ----------
@@ -57,9 +65,7 @@ def _add_unique_book_via_ui(page):
     page.click("text=Add Book to Catalog")
 
     # iii. Verify a success flash message appears and we are back on the catalog
-    page.wait_for_selector(".flash-success")
-    flash_text = page.inner_text(".flash-success")
-    assert "successfully added to catalog" in flash_text
+    expect(page.locator(".flash-success")).to_contain_text("successfully added to catalog")
 
     # iv. Verify the new book appears in the catalog table
     table_text = page.inner_text("table")
@@ -123,10 +129,9 @@ def test_borrow_book_from_catalog(page):
     row.get_by_role("button", name="Borrow").click()
 
     # Verify borrow confirmation flash message appears
-    page.wait_for_selector(".flash-success")
-    flash_text = page.inner_text(".flash-success")
-    assert "Borrowed" in flash_text
-    assert book["title"] in flash_text
+    flash = page.locator(".flash-success")
+    expect(flash).to_contain_text("Borrowed")
+    expect(flash).to_contain_text(book["title"])
 
     # After borrowing, the book should now show as "Not Available"
     page.click("text=Catalog")
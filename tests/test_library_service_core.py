@@ -1,6 +1,9 @@
 # tests/test_library_service_core.py
+import sqlite3
+
 import pytest
 from datetime import datetime, timedelta
+import database
 from services import library_service
 from services.library_service import pay_late_fees, refund_late_fee_payment
 from services.payment_service import PaymentGateway
@@ -51,12 +54,7 @@ def test_add_book_db_error(mocker):
 
 def test_borrow_book_success(mocker):
     mocker.patch("services.library_service._is_valid_patron_id", return_value=True)
-    mocker.patch("services.library_service.get_book_by_id", return_value={
-        "id": 10, "title": "Test Book", "available_copies": 2
-    })
-    mocker.patch("services.library_service.get_patron_borrow_count", return_value=0)
-    mocker.patch("services.library_service.insert_borrow_record", return_value=True)
-    mocker.patch("services.library_service.update_book_availability", return_value=True)
+    mocker.patch("services.library_service.borrow_atomic", return_value=("ok", "Test Book"))
 
     ok, msg = library_service.borrow_book_by_patron("123456", 10)
     assert ok is True
@@ -72,7 +70,7 @@ def test_borrow_book_invalid_patron_id():
 
 def test_borrow_book_not_found(mocker):
     mocker.patch("services.library_service._is_valid_patron_id", return_value=True)
-    mocker.patch("services.library_service.get_book_by_id", return_value=None)
+    mocker.patch("services.library_service.borrow_atomic", return_value=("not_found", None))
     ok, msg = library_service.borrow_book_by_patron("123456", 999)
     assert ok is False
     assert "not found" in msg.lower()
@@ -80,9 +78,7 @@ def test_borrow_book_not_found(mocker):
 
 def test_borrow_book_unavailable(mocker):
     mocker.patch("services.library_service._is_valid_patron_id", return_value=True)
-    mocker.patch("services.library_service.get_book_by_id", return_value={
-        "id": 10, "title": "Test Book", "available_copies": 0
-    })
+    mocker.patch("services.library_service.borrow_atomic", return_value=("unavailable", "Test Book"))
     ok, msg = library_service.borrow_book_by_patron("123456", 10)
     assert ok is False
     assert "not available" in msg.lower()
@@ -90,73 +86,51 @@ def test_borrow_book_unavailable(mocker):
 
 def test_borrow_book_over_limit(mocker):
     mocker.patch("services.library_service._is_valid_patron_id", return_value=True)
-    mocker.patch("services.library_service.get_book_by_id", return_value={
-        "id": 10, "title": "Test Book", "available_copies": 1
-    })
-    mocker.patch("services.library_service.get_patron_borrow_count", return_value=5)
+    mocker.patch("services.library_service.borrow_atomic", return_value=("limit_reached", "Test Book"))
     ok, msg = library_service.borrow_book_by_patron("123456", 10)
     assert ok is False
     assert "maximum borrowing limit" in msg.lower()
 
 
-def test_borrow_book_insert_record_fails(mocker):
+def test_borrow_book_db_error(mocker):
     mocker.patch("services.library_service._is_valid_patron_id", return_value=True)
-    mocker.patch("services.library_service.get_book_by_id", return_value={
-        "id": 10, "title": "Test Book", "available_copies": 1
-    })
-    mocker.patch("services.library_service.get_patron_borrow_count", return_value=0)
-    mocker.patch("services.library_service.insert_borrow_record", return_value=False)
+    mocker.patch(
+        "services.library_service.borrow_atomic",
+        side_effect=sqlite3.OperationalError("database is locked"),
+    )
 
     ok, msg = library_service.borrow_book_by_patron("123456", 10)
     assert ok is False
     assert "database error" in msg.lower()
 
 
-def test_borrow_book_update_availability_fails(mocker):
-    mocker.patch("services.library_service._is_valid_patron_id", return_value=True)
-    mocker.patch("services.library_service.get_book_by_id", return_value={
-        "id": 10, "title": "Test Book", "available_copies": 1
-    })
-    mocker.patch("services.library_service.get_patron_borrow_count", return_value=0)
-    mocker.patch("services.library_service.insert_borrow_record", return_value=True)
-    mocker.patch("services.library_service.update_book_availability", return_value=False)
-
-    ok, msg = library_service.borrow_book_by_patron("123456", 10)
+@pytest.mark.parametrize("book_id", [0, -3, "10", None, True])
+def test_borrow_book_invalid_book_id_skips_db(mocker, book_id):
+    atomic = mocker.patch("services.library_service.borrow_atomic")
+    ok, msg = library_service.borrow_book_by_patron("123456", book_id)
     assert ok is False
-    assert "database error" in msg.lower()
+    assert "not found" in msg.lower()
+    atomic.assert_not_called()
 
 
 # ---------- R4: return_book_by_patron ----------
 
 def test_return_book_success_with_fee(mocker):
     mocker.patch("services.library_service._is_valid_patron_id", return_value=True)
-    mocker.patch("services.library_service.get_book_by_id", return_value={
-        "id": 10, "title": "Test Book"
-    })
-    mocker.patch("services.library_service.update_borrow_record_return_date", return_value=True)
-    mocker.patch("services.library_service.update_book_availability", return_value=True)
-    # make fee nonzero
-    mocker.patch(
-        "services.library_service.calculate_late_fee_for_book",
-        return_value={"fee_amount": 3.5, "days_overdue": 2},
-    )
+    # due 2 days ago -> $1.00 late fee
+    due = database.epoch_seconds(datetime.now() - timedelta(days=2))
+    mocker.patch("services.library_service.return_atomic", return_value=("ok", "Test Book", due))
 
     ok, msg = library_service.return_book_by_patron("123456", 10)
     assert ok is True
     assert "late fee" in msg.lower()
+    assert "$1.00" in msg
 
 
 def test_return_book_success_no_fee(mocker):
     mocker.patch("services.library_service._is_valid_patron_id", return_value=True)
-    mocker.patch("services.library_service.get_book_by_id", return_value={
-        "id": 10, "title": "Test Book"
-    })
-    mocker.patch("services.library_service.update_borrow_record_return_date", return_value=True)
-    mocker.patch("services.library_service.update_book_availability", return_value=True)
-    mocker.patch(
-        "services.library_service.calculate_late_fee_for_book",
-        return_value={"fee_amount": 0.0, "days_overdue": 0},
-    )
+    due = database.epoch_seconds(datetime.now() + timedelta(days=3))
+    mocker.patch("services.library_service.return_atomic", return_value=("ok", "Test Book", due))
     ok, msg = library_service.return_book_by_patron("123456", 10)
     assert ok is True
     assert "no late fee" in msg.lower()
@@ -170,7 +144,7 @@ def test_return_book_invalid_patron():
 
 def test_return_book_not_found(mocker):
     mocker.patch("services.library_service._is_valid_patron_id", return_value=True)
-    mocker.patch("services.library_service.get_book_by_id", return_value=None)
+    mocker.patch("services.library_service.return_atomic", return_value=("not_found", None, None))
     ok, msg = library_service.return_book_by_patron("123456", 1)
     assert ok is False
     assert "not found" in msg.lower()
@@ -178,8 +152,7 @@ def test_return_book_not_found(mocker):
 
 def test_return_book_update_record_fails(mocker):
     mocker.patch("services.library_service._is_valid_patron_id", return_value=True)
-    mocker.patch("services.library_service.get_book_by_id", return_value={"id": 1, "title": "x"})
-    mocker.patch("services.library_service.update_borrow_record_return_date", return_value=False)
+    mocker.patch("services.library_service.return_atomic", return_value=("no_active_record", "x", None))
     ok, msg = library_service.return_book_by_patron("123456", 1)
     assert ok is False
     assert "no active borrow record" in msg.lower()
@@ -187,14 +160,20 @@ def test_return_book_update_record_fails(mocker):
 
 def test_return_book_update_availability_fails(mocker):
     mocker.patch("services.library_service._is_valid_patron_id", return_value=True)
-    mocker.patch("services.library_service.get_book_by_id", return_value={"id": 1, "title": "x"})
-    mocker.patch("services.library_service.update_borrow_record_return_date", return_value=True)
-    mocker.patch("services.library_service.update_book_availability", return_value=False)
+    mocker.patch("services.library_service.return_atomic", return_value=("availability_error", "x", None))
     ok, msg = library_service.return_book_by_patron("123456", 1)
     assert ok is False
     assert "database error" in msg.lower()
 
 
+def test_return_book_invalid_book_id_skips_db(mocker):
+    atomic = mocker.patch("services.library_service.return_atomic")
+    ok, msg = library_service.return_book_by_patron("123456", 0)
+    assert ok is False
+    assert "not found" in msg.lower()
+    atomic.assert_not_called()
+
+
 # ---------- R5: late fee calculation ----------
 
 def test_calculate_late_fee_found_overdue(mocker):
@@ -225,27 +204,30 @@ def test_calculate_late_fee_db_error_returns_zero(mocker):
     assert result["fee_amount"] == 0.0
 
 
+def test_calculate_late_fee_invalid_book_id_skips_db(mocker):
+    lookup = mocker.patch("services.library_service.database.get_patron_borrowed_books")
+    result = library_service.calculate_late_fee_for_book("123456", -1)
+    assert result == {"fee_amount": 0.0, "days_overdue": 0}
+    lookup.assert_not_called()
+
+
 # ---------- search_books_in_catalog ----------
 
 def test_search_books_empty_term_returns_empty():
     assert library_service.search_books_in_catalog("") == []
 
 
-def test_search_books_title(mocker):
-    mocker.patch("services.library_service.database.get_all_books", return_value=[
-        {"title": "Python 101", "author": "A"},
-        {"title": "Java 17", "author": "B"},
-    ])
+def test_search_books_title(tmp_db):
+    database.insert_book("Python 101", "A", "1111111111111", 1)
+    database.insert_book("Java 17", "B", "2222222222222", 1)
     results = library_service.search_books_in_catalog("python", "title")
     assert len(results) == 1
     assert results[0]["title"] == "Python 101"
 
 
-def test_search_books_author(mocker):
-    mocker.patch("services.library_service.database.get_all_books", return_value=[
-        {"title": "X", "author": "Grace Hopper"},
-        {"title": "Y", "author": "Other"},
-    ])
+def test_search_books_author(tmp_db):
+    database.insert_book("X", "Grace Hopper", "1111111111111", 1)
+    database.insert_book("Y", "Other", "2222222222222", 1)
     results = library_service.search_books_in_catalog("hopper", "author")
     assert len(results) == 1
 
@@ -256,9 +238,11 @@ def test_search_books_isbn(mocker):
     assert len(results) == 1
 
 
-def test_search_books_invalid_type():
+def test_search_books_invalid_type(mocker):
+    by_title = mocker.patch("services.library_service.database.search_books_title")
     results = library_service.search_books_in_catalog("term", "weird")
     assert results == []
+    by_title.assert_not_called()
 
 
 # ---------- R7: get_patron_status_report ----------
@@ -272,52 +256,46 @@ def test_get_patron_status_report_invalid_id():
 def test_get_patron_status_report_success(mocker):
     mocker.patch("services.library_service._is_valid_patron_id", return_value=True)
 
-    # current borrowed list: 1 item
-    mocker.patch(
-        "services.library_service.database.get_patron_borrowed_books",
-        return_value=[{
-            "book_id": 1,
-            "title": "T1",
-            "borrow_date": datetime.now(),
-            "due_date": datetime.now() + timedelta(days=1),
-        }],
-    )
-
-    # history list (doesn't affect total_late_fees in this implementation)
+    # one active loan 4 days overdue (-> $2.00) plus one returned loan
     mocker.patch(
-        "services.library_service.database.get_patron_borrow_history",
-        return_value=[{
-            "book_id": 1,
-            "title": "T1",
-            "borrow_date": datetime.now() - timedelta(days=10),
-            "return_date": datetime.now() - timedelta(days=5),
-            "late_fee": 2.0,
-        }],
+        "services.library_service.database.get_patron_loans_all",
+        return_value=[
+            {
+                "book_id": 1,
+                "title": "T1",
+                "borrow_date": datetime.now() - timedelta(days=18),
+                "due_date": datetime.now() - timedelta(days=4),
+                "return_date": None,
+                "is_active": True,
+            },
+            {
+                "book_id": 2,
+                "title": "T2",
+                "borrow_date": datetime.now() - timedelta(days=30),
+                "due_date": datetime.now() - timedelta(days=16),
+                "return_date": datetime.now() - timedelta(days=20),
+                "is_active": False,
+            },
+        ],
     )
 
-    # IMPORTANT: the function recomputes fees for *current* loans, so we stub that
-    mocker.patch(
-        "services.library_service.calculate_late_fee_for_book",
-        return_value={"fee_amount": 2.0, "days_overdue": 1},
-    )
+    # Fees are priced from the fetched rows, not by re-querying per book
+    fee_calc = mocker.patch("services.library_service.calculate_late_fee_for_book")
 
     report = library_service.get_patron_status_report("123456")
 
     assert report["num_currently_borrowed"] == 1
     assert report["total_late_fees"] == 2.0
     assert len(report["currently_borrowed"]) == 1
-    assert len(report["borrowing_history"]) == 1
+    assert len(report["borrowing_history"]) == 2
+    fee_calc.assert_not_called()
 
 
 
 def test_get_patron_status_report_handles_db_errors(mocker):
     mocker.patch("services.library_service._is_valid_patron_id", return_value=True)
     mocker.patch(
-        "services.library_service.database.get_patron_borrowed_books",
-        side_effect=Exception("db fail"),
-    )
-    mocker.patch(
-        "services.library_service.database.get_patron_borrow_history",
+        "services.library_service.database.get_patron_loans_all",
         side_effect=Exception("db fail"),
     )
     report = library_service.get_patron_status_report("123456")
@@ -17,7 +17,7 @@ def test_pay_late_fees_success(mocker):
 
     # stub book lookup
     mocker.patch(
-        "services.library_service.get_book_by_id",
+        "services.library_service.get_book_title_and_availability",
         return_value={"id": 1, "title": "Test Book"},
     )
 
@@ -44,7 +44,7 @@ def test_pay_late_fees_declined_by_gateway(mocker):
         return_value={"fee_amount": 7.00, "days_overdue": 3},
     )
     mocker.patch(
-        "services.library_service.get_book_by_id",
+        "services.library_service.get_book_title_and_availability",
         return_value={"id": 99, "title": "Another Book"},
     )
 
@@ -67,7 +67,7 @@ def test_pay_late_fees_invalid_patron_id_does_not_call_gateway(mocker):
         return_value={"fee_amount": 5.00, "days_overdue": 1},
     )
     mocker.patch(
-        "services.library_service.get_book_by_id",
+        "services.library_service.get_book_title_and_availability",
         return_value={"id": 1, "title": "Test Book"},
     )
 
@@ -89,7 +89,7 @@ def test_pay_late_fees_zero_fee_does_not_call_gateway(mocker):
         return_value={"fee_amount": 0.0, "days_overdue": 0},
     )
     mocker.patch(
-        "services.library_service.get_book_by_id",
+        "services.library_service.get_book_title_and_availability",
         return_value={"id": 1, "title": "Test Book"},
     )
 
@@ -110,7 +110,7 @@ def test_pay_late_fees_handles_gateway_exception(mocker):
         return_value={"fee_amount": 4.5, "days_overdue": 1},
     )
     mocker.patch(
-        "services.library_service.get_book_by_id",
+        "services.library_service.get_book_title_and_availability",
         return_value={"id": 2, "title": "Network Book"},
     )
 
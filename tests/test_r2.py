@@ -1,20 +1,27 @@
 # tests/test_r2.py
 import pytest
+from datetime import datetime, timedelta
 from app import create_app
 import app as app_module
 import routes.catalog_routes as catalog_routes
+import database
 
 @pytest.fixture
 def client(monkeypatch):
     """
-    Create Flask test client while preventing DB init/sample-data side effects.
+    Create Flask test client backed by a private in-memory database.
+    The shared-cache memory DB lives as long as a pooled connection holds it,
+    so closing the pool at teardown discards it.
     """
-    # Prevent database initialization and sample data insertion during tests
+    monkeypatch.setattr(database, 'DATABASE', 'file::memory:?cache=shared')
+    database.init_database()
+    # Schema is ready; skip the app's own init and sample data
     monkeypatch.setattr(app_module, 'init_database', lambda: None)
     monkeypatch.setattr(app_module, 'add_sample_data', lambda: None)
     app = create_app()
     app.testing = True
-    return app.test_client()
+    yield app.test_client()
+    database.close_pool()
 
 def test_catalog_displays_available_and_unavailable_books(client, monkeypatch):
     """
@@ -83,3 +90,65 @@ def test_get_all_books_is_invoked(client, monkeypatch):
     assert resp.status_code == 200
     assert called['count'] == 1, "Expected get_all_books to be called exactly once"
     assert '9999999999999' in resp.get_data(as_text=True)
+
+def test_get_all_books_cache_is_invalidated_by_writes(client):
+    """
+    get_all_books() serves repeat reads from its TTL cache, but a write through
+    the database module must be visible on the next read.
+    """
+    assert database.get_all_books() == []
+    book_id = database.insert_book('Cached Book', 'Author', '1234567890123', 2)
+    assert [b['title'] for b in database.get_all_books()] == ['Cached Book']
+
+    database.update_book_availability(book_id, -1)
+    assert database.get_all_books()[0]['available_copies'] == 1
+
+def test_get_all_books_does_not_cache_rows_read_before_a_write(client, monkeypatch):
+    """
+    A write that commits while get_all_books() is fetching must not leave the
+    pre-write rows in the cache.
+    """
+    book_id = database.insert_book('Racing Book', 'Author', '4444444444444', 3)
+    original_iter = database.iter_all_books
+
+    def fetch_then_concurrent_borrow():
+        rows = list(original_iter())
+        # Another request borrows a copy after this read saw available_copies == 3
+        database.borrow_atomic('123456', book_id, datetime.now(), datetime.now() + timedelta(days=14), 5)
+        yield from rows
+
+    monkeypatch.setattr(database, 'iter_all_books', fetch_then_concurrent_borrow)
+    assert database.get_all_books()[0]['available_copies'] == 3
+    monkeypatch.setattr(database, 'iter_all_books', original_iter)
+
+    assert database.get_all_books()[0]['available_copies'] == 2
+
+def test_get_all_books_callers_cannot_mutate_the_cache(client):
+    database.insert_book('Shared Book', 'Author', '5555555555555', 1)
+    database.get_all_books()[0]['title'] = 'Mutated'
+    assert database.get_all_books()[0]['title'] == 'Shared Book'
+
+def test_catalog_renders_from_in_memory_database(client):
+    """
+    With no route patching, the catalog reads the in-memory DB the fixture created.
+    """
+    database.insert_book('Memory Book', 'Author M', '3333333333333', 1)
+
+    resp = client.get('/catalog')
+    assert resp.status_code == 200
+    html = resp.get_data(as_text=True)
+    assert 'Memory Book' in html
+    assert '1/1 Available' in html
+
+def test_each_database_is_switched_to_wal(tmp_path, monkeypatch):
+    """
+    Swapping DATABASE (as tests do) must not leave the next file in rollback-journal mode.
+    """
+    modes = []
+    for name in ('a.db', 'b.db'):
+        monkeypatch.setattr(database, 'DATABASE', str(tmp_path / name))
+        database.init_database()
+        with database.borrow_conn() as conn:
+            modes.append(conn.execute('PRAGMA journal_mode').fetchone()['journal_mode'])
+        database.close_pool()
+    assert modes == ['wal', 'wal']
@@ -1,6 +1,9 @@
 # tests/test_r3.py
+import sqlite3
+
 import pytest
 from datetime import timedelta
+import database
 from services import library_service
 
 def _make_book(book_id=1, title="Book Title", available=1, total=1):
@@ -13,17 +16,29 @@ def _make_book(book_id=1, title="Book Title", available=1, total=1):
         "total_copies": total
     }
 
-def _patch_defaults(monkeypatch, *, book=None, borrow_count=0,
-                    insert_success=True, update_success=True):
+def _patch_defaults(monkeypatch, *, book=None, borrow_count=0, db_error=False, recorded=None):
     """
-    Helper to patch DB functions used by borrow_book_by_patron.
+    Patch the transactional borrow_atomic used by borrow_book_by_patron with an
+    in-memory stand-in that applies the same checks as the SQL version.
     """
     if book is None:
         book = _make_book()
-    monkeypatch.setattr(library_service, 'get_book_by_id', lambda book_id: book)
-    monkeypatch.setattr(library_service, 'get_patron_borrow_count', lambda patron_id: borrow_count)
-    monkeypatch.setattr(library_service, 'insert_borrow_record', lambda patron_id, book_id, borrow_date, due_date: insert_success)
-    monkeypatch.setattr(library_service, 'update_book_availability', lambda book_id, delta: update_success)
+
+    def fake_borrow_atomic(patron_id, book_id, borrow_date, due_date, max_borrows):
+        if recorded is not None:
+            recorded.update(patron_id=patron_id, book_id=book_id,
+                            borrow_date=borrow_date, due_date=due_date)
+        if db_error:
+            raise sqlite3.OperationalError("database is locked")
+        if book is None or book_id != book["id"]:
+            return 'not_found', None
+        if book["available_copies"] <= 0:
+            return 'unavailable', book["title"]
+        if borrow_count >= max_borrows:
+            return 'limit_reached', book["title"]
+        return 'ok', book["title"]
+
+    monkeypatch.setattr(library_service, 'borrow_atomic', fake_borrow_atomic)
 
 
 @pytest.mark.parametrize("patron_id", ["", "12345", "1234567", "ABC123", "12A456"])
@@ -40,10 +55,9 @@ def test_invalid_patron_id_rejected(patron_id, monkeypatch):
 
 def test_book_not_found(monkeypatch):
     """
-    If get_book_by_id returns None the function must return Book not found.
+    If the book does not exist the function must return Book not found.
     """
-    monkeypatch.setattr(library_service, 'get_book_by_id', lambda book_id: None)
-    monkeypatch.setattr(library_service, 'get_patron_borrow_count', lambda pid: 0)
+    _patch_defaults(monkeypatch, book=_make_book(1))
     success, message = library_service.borrow_book_by_patron("123456", 999)
     assert success is False
     assert message == "Book not found."
@@ -83,51 +97,27 @@ def test_patron_exceeds_limit_current_logic(monkeypatch):
     assert message == "You have reached the maximum borrowing limit of 5 books."
 
 
-def test_db_insert_failure_returns_error(monkeypatch):
+def test_db_failure_returns_error(monkeypatch):
     """
-    If insert_borrow_record fails, function should return a database error message.
+    If the borrow transaction fails, function should return a database error message.
     """
     book = _make_book(4, "DB Fail Book", available=1, total=1)
-    _patch_defaults(monkeypatch, book=book, borrow_count=0, insert_success=False, update_success=True)
+    _patch_defaults(monkeypatch, book=book, borrow_count=0, db_error=True)
     success, message = library_service.borrow_book_by_patron("222222", 4)
     assert success is False
     assert message == "Database error occurred while creating borrow record."
 
 
-def test_update_availability_failure_returns_error(monkeypatch):
-    """
-    If update_book_availability fails after a successful insert, the function should return an error.
-    """
-    book = _make_book(5, "Avail Update Fail", available=1, total=1)
-    _patch_defaults(monkeypatch, book=book, borrow_count=0, insert_success=True, update_success=False)
-    success, message = library_service.borrow_book_by_patron("333333", 5)
-    assert success is False
-    assert message == "Database error occurred while updating book availability."
-
-
 def test_successful_borrow_records_and_message(monkeypatch):
     """
     Successful flow:
-    - insert_borrow_record returns True
-    - update_book_availability returns True
+    - borrow_atomic returns 'ok'
     - return True and a message containing the title and due date in YYYY-MM-DD
-    - verify that the borrow and due dates passed to insert_borrow_record differ by exactly 14 days
+    - verify that the borrow and due dates passed to borrow_atomic differ by exactly 14 days
     """
     recorded = {}
     book = _make_book(10, "Successful Borrow", available=2, total=2)
-    # Patch get_book_by_id and get_patron_borrow_count
-    monkeypatch.setattr(library_service, 'get_book_by_id', lambda book_id: book)
-    monkeypatch.setattr(library_service, 'get_patron_borrow_count', lambda pid: 0)
-
-    def fake_insert(patron_id, book_id, borrow_date, due_date):
-        recorded['patron_id'] = patron_id
-        recorded['book_id'] = book_id
-        recorded['borrow_date'] = borrow_date
-        recorded['due_date'] = due_date
-        return True
-
-    monkeypatch.setattr(library_service, 'insert_borrow_record', fake_insert)
-    monkeypatch.setattr(library_service, 'update_book_availability', lambda book_id, delta: True)
+    _patch_defaults(monkeypatch, book=book, borrow_count=0, recorded=recorded)
 
     success, message = library_service.borrow_book_by_patron("444444", 10)
     assert success is True
@@ -138,3 +128,20 @@ def test_successful_borrow_records_and_message(monkeypatch):
     assert (recorded['due_date'] - recorded['borrow_date']) == timedelta(days=14)
     expected_date_str = recorded['due_date'].strftime("%Y-%m-%d")
     assert expected_date_str in message
+
+
+# ---------- borrow_atomic against a real SQLite file ----------
+
+def test_borrow_atomic_decrements_and_records(tmp_db):
+    book_id = database.insert_book("Real Book", "Author", "1234567890123", 1)
+
+    success, _ = library_service.borrow_book_by_patron("123456", book_id)
+    assert success is True
+    assert database.get_book_by_id(book_id)['available_copies'] == 0
+    assert database.get_patron_borrow_count("123456") == 1
+
+    # The last copy is gone, so a second patron is rejected and nothing is written
+    success, message = library_service.borrow_book_by_patron("654321", book_id)
+    assert success is False
+    assert message == "This book is currently not available."
+    assert database.get_patron_borrow_count("654321") == 0
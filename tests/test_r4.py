@@ -1,6 +1,7 @@
 # tests/test_r4.py
 import pytest
-from datetime import datetime
+from datetime import datetime, timedelta
+import database
 from services import library_service
 
 def _make_book(book_id=1, title="Returned Book", author="Author", isbn="1234567890123", total=2, available=1):
@@ -13,26 +14,32 @@ def _make_book(book_id=1, title="Returned Book", author="Author", isbn="12345678
         "available_copies": available
     }
 
-def _patch_defaults(monkeypatch, *, book=None,
-                    update_return_success=True, update_avail_success=True,
-                    fee_result=None):
+def _patch_defaults(monkeypatch, *, book=None, has_active_record=True,
+                    availability_ok=True, due_date=None, recorded=None):
     """
-    Patch the DB and helper functions library_service would call:
-      - get_book_by_id -> returns book dict
-      - update_borrow_record_return_date -> returns update_return_success
-      - update_book_availability -> returns update_avail_success
-      - calculate_late_fee_for_book -> returns fee_result (dict) or {'fee_amount':0.0,...} if None
+    Patch the transactional return_atomic used by return_book_by_patron:
+      - unknown book -> 'not_found'
+      - has_active_record=False -> 'no_active_record'
+      - availability_ok=False -> 'availability_error'
+      - otherwise 'ok' with the record's due_date_epoch (defaults to tomorrow, i.e. no fee)
     """
     if book is None:
         book = _make_book()
-    monkeypatch.setattr(library_service, 'get_book_by_id', lambda book_id: book)
-    def fake_update_return(patron_id, book_id, return_date):
-        return update_return_success
-    monkeypatch.setattr(library_service, 'update_borrow_record_return_date', fake_update_return)
-    monkeypatch.setattr(library_service, 'update_book_availability', lambda bid, delta: update_avail_success)
-    if fee_result is None:
-        fee_result = {'fee_amount': 0.0, 'days_overdue': 0, 'status': 'No late fee'}
-    monkeypatch.setattr(library_service, 'calculate_late_fee_for_book', lambda patron_id, book_id: fee_result)
+    if due_date is None:
+        due_date = datetime.now() + timedelta(days=1)
+
+    def fake_return_atomic(patron_id, book_id, return_date):
+        if recorded is not None:
+            recorded.update(patron_id=patron_id, book_id=book_id, return_date=return_date)
+        if book is None or book_id != book["id"]:
+            return 'not_found', None, None
+        if not has_active_record:
+            return 'no_active_record', book["title"], None
+        if not availability_ok:
+            return 'availability_error', book["title"], None
+        return 'ok', book["title"], database.epoch_seconds(due_date)
+
+    monkeypatch.setattr(library_service, 'return_atomic', fake_return_atomic)
 
 
 @pytest.mark.parametrize("patron_id", ["", "12345", "1234567", "ABCDEF", "12A456"])
@@ -52,8 +59,8 @@ def test_return_no_active_borrow_record(monkeypatch):
     This test asserts the spec-driven behavior and expects an explanatory error message.
     """
     book = _make_book(1, title="Never Borrowed", available=1)
-    # Simulate DB update returning False (no active borrow record)
-    _patch_defaults(monkeypatch, book=book, update_return_success=False, update_avail_success=True)
+    # Simulate the transaction finding no active borrow record
+    _patch_defaults(monkeypatch, book=book, has_active_record=False)
     success, message = library_service.return_book_by_patron("123456", 1)
     assert success is False
     # Expected message according to spec: no active borrow record found
@@ -62,11 +69,10 @@ def test_return_no_active_borrow_record(monkeypatch):
 
 def test_return_update_availability_failure(monkeypatch):
     """
-    If updating availability fails after a successful return-record update, function should return an error.
+    If updating availability fails after finding the borrow record, function should return an error.
     """
     book = _make_book(2, title="Availability Fail", available=0, total=1)
-    # update return succeeds but update availability fails
-    _patch_defaults(monkeypatch, book=book, update_return_success=True, update_avail_success=False)
+    _patch_defaults(monkeypatch, book=book, availability_ok=False)
     success, message = library_service.return_book_by_patron("222222", 2)
     assert success is False
     assert message == "Database error occurred while updating book availability."
@@ -75,14 +81,12 @@ def test_return_update_availability_failure(monkeypatch):
 def test_successful_return_shows_late_fee(monkeypatch):
     """
     Successful return flow:
-    - update_borrow_record_return_date returns True
-    - update_book_availability returns True
-    - calculate_late_fee_for_book returns a non-zero fee
+    - return_atomic returns 'ok' with a due date 3 days in the past
+    - the late fee is priced from that due date (3 days * $0.50)
     The returned message should include the book title and the late fee formatted with 2 decimal places (e.g., $1.50)
     """
     book = _make_book(3, title="Late Fee Book", available=0, total=1)
-    fee = {'fee_amount': 1.5, 'days_overdue': 3, 'status': 'Overdue'}
-    _patch_defaults(monkeypatch, book=book, update_return_success=True, update_avail_success=True, fee_result=fee)
+    _patch_defaults(monkeypatch, book=book, due_date=datetime.now() - timedelta(days=3))
 
     success, message = library_service.return_book_by_patron("333333", 3)
     assert success is True
@@ -96,8 +100,7 @@ def test_successful_return_no_late_fee(monkeypatch):
     Successful return with no late fee: message should still confirm return and indicate $0.00 or no fee.
     """
     book = _make_book(4, title="OnTime Book", available=0, total=1)
-    fee = {'fee_amount': 0.0, 'days_overdue': 0, 'status': 'No late fee'}
-    _patch_defaults(monkeypatch, book=book, update_return_success=True, update_avail_success=True, fee_result=fee)
+    _patch_defaults(monkeypatch, book=book, due_date=datetime.now() + timedelta(days=5))
 
     success, message = library_service.return_book_by_patron("444444", 4)
     assert success is True
@@ -108,21 +111,12 @@ def test_successful_return_no_late_fee(monkeypatch):
 
 def test_return_records_return_date(monkeypatch):
     """
-    The function should pass a return_date to update_borrow_record_return_date.
+    The function should pass a return_date to return_atomic.
     We record the argument and assert it's a datetime close to now.
     """
     recorded = {}
     book = _make_book(5, title="Record Date Book", available=0, total=1)
-
-    monkeypatch.setattr(library_service, 'get_book_by_id', lambda bid: book)
-    def fake_update_return(patron_id, book_id, return_date):
-        recorded['patron_id'] = patron_id
-        recorded['book_id'] = book_id
-        recorded['return_date'] = return_date
-        return True
-    monkeypatch.setattr(library_service, 'update_borrow_record_return_date', fake_update_return)
-    monkeypatch.setattr(library_service, 'update_book_availability', lambda bid, delta: True)
-    monkeypatch.setattr(library_service, 'calculate_late_fee_for_book', lambda pid, bid: {'fee_amount': 0.0, 'days_overdue': 0, 'status': 'No late fee'})
+    _patch_defaults(monkeypatch, book=book, recorded=recorded)
 
     success, message = library_service.return_book_by_patron("555555", 5)
     assert success is True
@@ -130,3 +124,38 @@ def test_return_records_return_date(monkeypatch):
     assert isinstance(recorded['return_date'], datetime)
     # return_date should be recent (within 10 seconds)
     assert (datetime.now() - recorded['return_date']).total_seconds() < 10
+
+
+# ---------- return_atomic against a real SQLite file ----------
+
+def test_return_atomic_restores_availability_and_prices_fee(tmp_db):
+    book_id = database.insert_book("Late Real Book", "Author", "1234567890123", 1)
+    borrowed_at = datetime.now() - timedelta(days=17)
+    database.borrow_atomic("123456", book_id, borrowed_at, borrowed_at + timedelta(days=14), 5)
+
+    success, message = library_service.return_book_by_patron("123456", book_id)
+    assert success is True
+    assert "$1.50" in message
+    assert database.get_book_by_id(book_id)['available_copies'] == 1
+    assert database.get_active_borrow_record("123456", book_id) is None
+
+    # A second return of the same book has nothing to close
+    success, message = library_service.return_book_by_patron("123456", book_id)
+    assert success is False
+    assert message == "No active borrow record found for this patron and book."
+
+
+def test_bulk_availability_update_is_all_or_nothing(tmp_db):
+    first = database.insert_book("Kiosk One", "Author", "1111111111111", 2)
+    second = database.insert_book("Kiosk Two", "Author", "2222222222222", 1)
+    database.update_book_availability_bulk({first: -2, second: -1})
+
+    # Returning both at a kiosk restores both copies in one statement
+    assert database.update_book_availability_bulk({first: +1, second: +1}) is True
+    assert database.get_book_by_id(first)['available_copies'] == 1
+    assert database.get_book_by_id(second)['available_copies'] == 1
+
+    # second is already full, so the whole batch is rejected
+    assert database.update_book_availability_bulk({first: +1, second: +1}) is False
+    assert database.get_book_by_id(first)['available_copies'] == 1
+    assert database.update_book_availability(9999, +1) is False
@@ -110,3 +110,43 @@ def test_no_borrow_record_returns_zero_fee(monkeypatch):
     # defensive: if function includes status message, keep test flexible and only require zero fee/days
     assert round(float(result.get('fee_amount', 0.0)), 2) == 0.00
     assert int(result.get('days_overdue', 0)) == 0
+
+
+def test_epoch_pricing_matches_iso_pricing(monkeypatch):
+    """
+    Rows carrying due_date_epoch are priced with integer day math; the result
+    must match pricing the same due date from its datetime.
+    """
+    patron_id = '123456'
+    for days_late in (0, 3, 10, 40):
+        due = datetime.now() - timedelta(days=days_late)
+        record = _make_record_for_book(1, due)
+        record[0]['due_date_epoch'] = database.epoch_seconds(due)
+        monkeypatch.setattr(database, 'get_patron_borrowed_books', lambda pid, r=record: r)
+
+        result = library_service.calculate_late_fee_for_book(patron_id, 1)
+        assert result['days_overdue'] == days_late
+        assert result['fee_amount'] == _expected_fee(days_late)
+
+
+def test_init_database_backfills_due_date_epoch(tmp_db):
+    """
+    A database created before due_date_epoch existed gets the column added and backfilled.
+    """
+    due = datetime(2024, 1, 15, 10, 30, 0, 123456)
+    with database.borrow_conn() as conn:
+        # Swap in the pre-migration schema, then let init_database() upgrade it
+        conn.execute("DROP TABLE borrow_records")
+        conn.execute(
+            "CREATE TABLE borrow_records (id INTEGER PRIMARY KEY AUTOINCREMENT, patron_id TEXT NOT NULL, "
+            "book_id INTEGER NOT NULL, borrow_date TEXT NOT NULL, due_date TEXT NOT NULL, return_date TEXT NULL)"
+        )
+        conn.execute(
+            "INSERT INTO borrow_records(patron_id, book_id, borrow_date, due_date) VALUES ('123456', 1, ?, ?)",
+            ((due - timedelta(days=14)).isoformat(), due.isoformat())
+        )
+
+    database.init_database()
+    with database.borrow_conn() as conn:
+        row = conn.execute("SELECT due_date_epoch FROM borrow_records").fetchone()
+    assert row['due_date_epoch'] == database.epoch_seconds(due)
@@ -12,12 +12,17 @@ _SAMPLE_BOOKS: List[Dict] = [
     {'id': 4, 'title': 'Gatsby Reimagined', 'author': 'Some Author', 'isbn': '9781111111111', 'total_copies': 1, 'available_copies': 1},
 ]
 
-def test_search_title_partial_case_insensitive(monkeypatch):
+@pytest.fixture
+def seeded_db(tmp_db):
+    database.bulk_insert_books([
+        (b['title'], b['author'], b['isbn'], b['total_copies'], b['available_copies'])
+        for b in _SAMPLE_BOOKS
+    ])
+
+def test_search_title_partial_case_insensitive(seeded_db):
     """
     Partial, case-insensitive search by title.
     """
-    monkeypatch.setattr(database, 'get_all_books', lambda: _SAMPLE_BOOKS.copy())
-
     results = library_service.search_books_in_catalog('gatsby', 'title')
 
     assert isinstance(results, list)
@@ -27,12 +32,14 @@ def test_search_title_partial_case_insensitive(monkeypatch):
     assert 'Gatsby Reimagined' in titles
     assert len(results) == 2
 
-def test_search_author_partial_case_insensitive(monkeypatch):
+    # Partial means anywhere in the title, not just at a word start
+    results = library_service.search_books_in_catalog('atsby', 'title')
+    assert [r['title'] for r in results] == ['The Great Gatsby', 'Gatsby Reimagined']
+
+def test_search_author_partial_case_insensitive(seeded_db):
     """
     Partial, case-insensitive search by author.
     """
-    monkeypatch.setattr(database, 'get_all_books', lambda: _SAMPLE_BOOKS.copy())
-
     results = library_service.search_books_in_catalog('orWell', 'author')  # mixed case to test case-insensitive
 
     assert isinstance(results, list)
@@ -49,9 +56,6 @@ def test_search_isbn_exact_match(monkeypatch):
     # Provide a DB-level ISBN lookup for exact-match behavior
     target_isbn = '9780451524935'
     monkeypatch.setattr(database, 'get_book_by_isbn', lambda isbn: next((b for b in _SAMPLE_BOOKS if b['isbn'] == isbn), None))
-    # Ensure get_all_books is not used for ISBN search (but patching safe fallback)
-    monkeypatch.setattr(database, 'get_all_books', lambda: _SAMPLE_BOOKS.copy())
-
     # exact match -> returns one result
     results_exact = library_service.search_books_in_catalog(target_isbn, 'isbn')
     assert isinstance(results_exact, list)
@@ -64,12 +68,10 @@ def test_search_isbn_exact_match(monkeypatch):
     assert isinstance(results_partial, list)
     assert len(results_partial) == 0
 
-def test_search_no_results_returns_empty_list(monkeypatch):
+def test_search_no_results_returns_empty_list(seeded_db):
     """
     Searching for a term that doesn't exist should return an empty list.
     """
-    monkeypatch.setattr(database, 'get_all_books', lambda: _SAMPLE_BOOKS.copy())
-
     results = library_service.search_books_in_catalog('nonexistent term', 'title')
     assert isinstance(results, list)
     assert results == []
@@ -78,9 +80,80 @@ def test_search_invalid_type_returns_empty_list(monkeypatch):
     """
     If an invalid search type is supplied, the function should not crash.
     """
-    monkeypatch.setattr(database, 'get_all_books', lambda: _SAMPLE_BOOKS.copy())
     monkeypatch.setattr(database, 'get_book_by_isbn', lambda isbn: None)
 
     results = library_service.search_books_in_catalog('gatsby', 'invalid_type')
     assert isinstance(results, list)
     assert results == []
+
+# ---------- FTS5-backed search against a real SQLite file ----------
+
+def test_fts_title_and_author_substring_search(seeded_db):
+    """
+    Title/author search uses the trigram books_fts index: case-insensitive substring matches.
+    """
+    titles = [r['title'] for r in database.search_books_title('GATS')]
+    assert titles == ['The Great Gatsby', 'Gatsby Reimagined']
+    assert [r['title'] for r in database.search_books_title('kill a mock')] == ['To Kill a Mockingbird']
+
+    # Terms shorter than a trigram fall back to scanning books
+    assert [r['title'] for r in database.search_books_title('98')] == ['1984']
+
+    authors = [r['author'] for r in database.search_books_author('orwell')]
+    assert authors == ['George Orwell']
+
+    assert database.search_books_title('"unbalanced') == []
+
+def test_short_search_folds_non_ascii_case(tmp_db):
+    """
+    The short-term scan folds case like str.lower(), not just ASCII, matching the trigram path.
+    """
+    database.insert_book('Élan Vital', 'Henri Bergson', '9780000000001', 1)
+
+    assert [r['title'] for r in database.search_books_title('él')] == ['Élan Vital']
+    assert [r['title'] for r in database.search_books_title('élan')] == ['Élan Vital']
+
+def test_fts_index_follows_title_updates(seeded_db):
+    """
+    Triggers keep books_fts in sync when a title changes.
+    """
+    with database.borrow_conn() as conn:
+        conn.execute("UPDATE books SET title = 'Nineteen Eighty-Four' WHERE isbn = '9780451524935'")
+
+    assert [r['title'] for r in database.search_books_title('nineteen')] == ['Nineteen Eighty-Four']
+    assert database.search_books_title('1984') == []
+
+def test_init_database_reindexes_word_tokenized_fts(seeded_db):
+    """
+    A books_fts built with the old word tokenizer is rebuilt as a trigram index.
+    """
+    with database.borrow_conn() as conn:
+        conn.execute("DROP TABLE books_fts")
+        conn.execute(
+            "CREATE VIRTUAL TABLE books_fts USING fts5("
+            "title, author, content='books', content_rowid='id', tokenize='unicode61')"
+        )
+        conn.execute("INSERT INTO books_fts(books_fts) VALUES ('rebuild')")
+
+    database.init_database()
+    results = library_service.search_books_in_catalog('atsby', 'title')
+    assert [r['title'] for r in results] == ['The Great Gatsby', 'Gatsby Reimagined']
+
+def test_search_falls_back_to_scan_without_fts(tmp_path, monkeypatch):
+    """
+    If books_fts cannot be created (no FTS5 / trigram), the app still starts and search scans books.
+    """
+    monkeypatch.setattr(database, 'DATABASE', str(tmp_path / 'no_fts.db'))
+    monkeypatch.setattr(database, '_SQL_CREATE_BOOKS_FTS',
+                        "CREATE VIRTUAL TABLE books_fts USING no_such_module(title, author)")
+    database.init_database()
+    try:
+        database.bulk_insert_books([
+            (b['title'], b['author'], b['isbn'], b['total_copies'], b['available_copies'])
+            for b in _SAMPLE_BOOKS
+        ])
+        results = library_service.search_books_in_catalog('atsby', 'title')
+        assert [r['title'] for r in results] == ['The Great Gatsby', 'Gatsby Reimagined']
+        assert [r['author'] for r in database.search_books_author('ORWELL')] == ['George Orwell']
+    finally:
+        database.close_pool()
@@ -14,7 +14,8 @@ def _borrow_record(book_id: int, title: str, days_ago_borrowed: int, days_until_
         'author': f'Author {book_id}',
         'borrow_date': borrow_date,
         'due_date': due_date,
-        'is_overdue': datetime.now() > due_date
+        'return_date': None,
+        'is_active': True
     }
 
 def _history_record(book_id: int, title: str, borrow_days_ago: int, return_days_ago: int):
@@ -23,8 +24,11 @@ def _history_record(book_id: int, title: str, borrow_days_ago: int, return_days_
     return {
         'book_id': book_id,
         'title': title,
+        'author': f'Author {book_id}',
         'borrow_date': borrow_date,
-        'return_date': return_date
+        'due_date': borrow_date + timedelta(days=14),
+        'return_date': return_date,
+        'is_active': return_date is None
     }
 
 
@@ -40,21 +44,10 @@ def test_patron_status_includes_all_keys_and_aggregates_fees(monkeypatch):
         _history_record(4, 'Returned Book B', borrow_days_ago=120, return_days_ago=100)
     ]
 
-    # Mock DB functions
-    monkeypatch.setattr(database, 'get_patron_borrowed_books', lambda pid: borrowed)
-    monkeypatch.setattr(database, 'get_patron_borrow_count', lambda pid: len(borrowed))
-
-    # Mock history function which may or may not exist in DB module in the project.
-    # Use raising=False so the patch creates attribute if missing.
-    monkeypatch.setattr(database, 'get_patron_borrow_history', lambda pid: history, raising=False)
+    # Mock the single loans query: active borrows plus returned ones
+    monkeypatch.setattr(database, 'get_patron_loans_all', lambda pid: borrowed + history)
 
-    # Mock late-fee calculation per-book: book 1 => $1.50, book 2 => $0.00
-    def fake_fee_calc(pid, bid):
-        if bid == 1:
-            return {'fee_amount': 1.50, 'days_overdue': 3}
-        else:
-            return {'fee_amount': 0.00, 'days_overdue': 0}
-    monkeypatch.setattr(library_service, 'calculate_late_fee_for_book', fake_fee_calc, raising=False)
+    # Fees are priced from each loan's due date: book 1 is 3 days late => $1.50, book 2 => $0.00
 
     report = library_service.get_patron_status_report(patron_id)
 
@@ -71,9 +64,9 @@ def test_patron_status_includes_all_keys_and_aggregates_fees(monkeypatch):
     for item in report['currently_borrowed']:
         assert 'book_id' in item and 'title' in item and 'due_date' in item
 
-    # borrowing_history should be a list (may be empty)
+    # borrowing_history covers every loan, active ones included
     assert isinstance(report['borrowing_history'], list)
-    assert len(report['borrowing_history']) == 2
+    assert len(report['borrowing_history']) == 4
 
     # num_currently_borrowed must be integer and equal to len(currently_borrowed)
     assert isinstance(report['num_currently_borrowed'], int)
@@ -88,12 +81,7 @@ def test_patron_status_includes_all_keys_and_aggregates_fees(monkeypatch):
 
 def test_no_current_borrows_returns_zero_totals(monkeypatch):
     patron_id = '222222'
-    monkeypatch.setattr(database, 'get_patron_borrowed_books', lambda pid: [])
-    monkeypatch.setattr(database, 'get_patron_borrow_count', lambda pid: 0)
-    monkeypatch.setattr(database, 'get_patron_borrow_history', lambda pid: [], raising=False)
-
-    # Ensure that if calculate_late_fee_for_book is called, it returns zero (defensive)
-    monkeypatch.setattr(library_service, 'calculate_late_fee_for_book', lambda pid, bid: {'fee_amount': 0.0, 'days_overdue': 0}, raising=False)
+    monkeypatch.setattr(database, 'get_patron_loans_all', lambda pid: [])
 
     report = library_service.get_patron_status_report(patron_id)
 
@@ -110,14 +98,11 @@ def test_borrowing_history_items_have_expected_fields(monkeypatch):
     Borrowing history should present past borrow records with borrow_date and return_date.
     """
     patron_id = '333333'
-    monkeypatch.setattr(database, 'get_patron_borrowed_books', lambda pid: [])
-    monkeypatch.setattr(database, 'get_patron_borrow_count', lambda pid: 0)
-
     history = [
         _history_record(10, 'Old Book One', borrow_days_ago=200, return_days_ago=150),
         _history_record(11, 'Old Book Two', borrow_days_ago=400, return_days_ago=300)
     ]
-    monkeypatch.setattr(database, 'get_patron_borrow_history', lambda pid: history, raising=False)
+    monkeypatch.setattr(database, 'get_patron_loans_all', lambda pid: history)
 
     report = library_service.get_patron_status_report(patron_id)
 
@@ -147,3 +132,59 @@ def test_handles_invalid_patron_id_gracefully(monkeypatch):
     assert isinstance(report.get('borrowing_history', []), list)
     assert isinstance(report.get('num_currently_borrowed', 0), int)
     assert float(report.get('total_late_fees', 0.0)) >= 0.0
+
+
+def test_status_report_reads_the_clock_once_for_all_loans(monkeypatch):
+    """
+    Epoch-priced loans share one precomputed day number instead of converting now per loan.
+    """
+    loans = []
+    for book_id in range(1, 4):
+        loan = _borrow_record(book_id, f'Book {book_id}', days_ago_borrowed=20, days_until_due=-2)
+        loan['due_date_epoch'] = database.epoch_seconds(loan['due_date'])
+        loans.append(loan)
+    monkeypatch.setattr(database, 'get_patron_loans_all', lambda pid: loans)
+
+    calls = []
+    real_epoch_seconds = database.epoch_seconds
+    monkeypatch.setattr(database, 'epoch_seconds', lambda dt: calls.append(dt) or real_epoch_seconds(dt))
+
+    report = library_service.get_patron_status_report('123456')
+    assert len(calls) == 1
+    assert report['total_late_fees'] == 3.00
+
+
+def test_status_report_from_real_database(tmp_db):
+    """
+    End-to-end over SQLite: one JOIN feeds both current loans and history.
+    """
+    kept = database.insert_book('Kept Book', 'Author', '1111111111111', 1)
+    returned = database.insert_book('Returned Book', 'Author', '2222222222222', 1)
+    borrowed_at = datetime.now() - timedelta(days=16)
+    database.borrow_atomic('123456', kept, borrowed_at, borrowed_at + timedelta(days=14), 5)
+    database.borrow_atomic('123456', returned, datetime.now(), datetime.now() + timedelta(days=14), 5)
+    database.return_atomic('123456', returned, datetime.now())
+
+    report = library_service.get_patron_status_report('123456')
+
+    assert [r['title'] for r in report['currently_borrowed']] == ['Kept Book']
+    assert [r['title'] for r in report['borrowing_history']] == ['Returned Book', 'Kept Book']
+    assert report['num_currently_borrowed'] == 1
+    assert report['total_late_fees'] == 1.00
+
+def test_malformed_stored_date_is_logged(tmp_db, caplog):
+    """
+    A corrupt date empties the patron's loans, but the failure is logged rather than silent.
+    """
+    book_id = database.insert_book('Corrupt Book', 'Author', '3333333333333', 1)
+    database.borrow_atomic('123456', book_id, datetime.now(), datetime.now() + timedelta(days=14), 5)
+    with database.borrow_conn() as conn:
+        conn.execute("UPDATE borrow_records SET due_date = 'not-a-date'")
+
+    with caplog.at_level('ERROR', logger='database'):
+        assert database.get_patron_loans_all('123456') == []
+        assert database.get_patron_borrowed_books('123456') == []
+    assert [r.getMessage() for r in caplog.records] == [
+        'Malformed stored date in loans for patron 123456',
+        'Malformed stored date in active loans for patron 123456',
+    ]